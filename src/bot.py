@@ -1,217 +1,613 @@
-import os
+import time
+import random
 import asyncio
+import hashlib
+import json
+import queue
+import atexit
+import signal
 import aiohttp
 import logging
-from typing import Optional, Dict, Any, List
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Optional, Dict, Any, List, Set, Tuple, Callable, Awaitable, Iterable
+from telebot import asyncio_helper
 from telebot.async_telebot import AsyncTeleBot
-from dotenv import load_dotenv
 from aiohttp import ClientTimeout, TCPConnector
 from datetime import datetime
+from collections import OrderedDict
+from config import config
+
+try:
+    import orjson
+except ImportError:  # orjson необязателен, без него используется стандартный json
+    orjson = None
+
+# Настройка логирования: запись в файл выполняется в фоновом потоке, чтобы не блокировать event loop
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+file_handler = RotatingFileHandler('bot.log', maxBytes=10_000_000, backupCount=5, encoding='utf-8')
+file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+log_listener = QueueListener(log_queue, file_handler)
+
+# QueueHandler подставляет в запись готовый текст сообщения, оформление добавит file_handler
+queue_handler = QueueHandler(log_queue)
+queue_handler.setFormatter(logging.Formatter('%(message)s'))
 
-# Настройка логирования
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    format=LOG_FORMAT,
     handlers=[
-        logging.FileHandler('bot.log', encoding='utf-8'),
+        queue_handler,
         logging.StreamHandler()
     ]
 )
+log_listener.start()
+atexit.register(log_listener.stop)
 logger = logging.getLogger(__name__)
 
-class Config:
-    def __init__(self):  
-        load_dotenv()
-        self.BOT_TOKEN: str = os.getenv('BOT_TOKEN', '')
-        self.API_URL: str = os.getenv('API_URL', '')
-        self.MAX_RETRIES: int = int(os.getenv('MAX_RETRIES', '3'))
-        self.TIMEOUT: int = int(os.getenv('TIMEOUT', '120'))  # Увеличенный таймаут
-        self.MAX_TEXT_LENGTH: int = int(os.getenv('MAX_TEXT_LENGTH', '4096'))
-        self.RETRY_DELAY: int = int(os.getenv('RETRY_DELAY', '5'))
-        
-        if not self.BOT_TOKEN:
-            raise ValueError("BOT_TOKEN не найден в .env файле")
+if orjson is not None:
+    json_dumps = orjson.dumps
+    json_loads = orjson.loads
+else:
+    def json_dumps(obj: Any) -> bytes:
+        return json.dumps(obj, ensure_ascii=False).encode('utf-8')
+    json_loads = json.loads
 
-config = Config()
+# Снимаем ограничение на число соединений во внутренней сессии pyTelegramBotAPI
+asyncio_helper.REQUEST_LIMIT = 0
 bot = AsyncTeleBot(config.BOT_TOKEN)
 
+# Telegram не пропускает текстовые сообщения длиннее 4096 символов
+TELEGRAM_MAX_TEXT_LENGTH = 4096
+
+# Обрезать текст нужно, только если лимит API строже лимита Telegram
+TRUNCATE_AT: Optional[int] = (
+    config.MAX_TEXT_LENGTH if config.MAX_TEXT_LENGTH < TELEGRAM_MAX_TEXT_LENGTH else None
+)
+
+# Параметры запросов к API задаются один раз на уровне общей сессии
+API_TIMEOUT = ClientTimeout(total=config.TIMEOUT, connect=10, sock_connect=10)
+API_HEADERS = {"Content-Type": "application/json", "Accept": "application/json"}
+
+# Тело запроса на классификацию без поля text: остальные поля всегда одинаковы
+PAYLOAD_PREFIX = b'{"text":'
+PAYLOAD_SUFFIX = b',"name":null,"topic":null,"generate_answer":true}'
+
 class APIResponse:
-    def __init__(self, success: bool, data: Optional[Dict] = None, error: Optional[str] = None):
+    def __init__(self, success: bool, data: Optional[Dict] = None, error: Optional[str] = None,
+                 retryable: bool = False):
         self.success = success
         self.data = data or {}
         self.error = error
+        # Имеет ли смысл повторить запрос (сетевые ошибки, таймауты, 5xx и 429)
+        self.retryable = retryable
+
+class ResponseCache:
+    """LRU-кэш успешных ответов API с ограниченным временем жизни записей."""
+
+    def __init__(self, ttl: float, max_size: int):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._items: "OrderedDict[bytes, Tuple[float, APIResponse]]" = OrderedDict()
+
+    @staticmethod
+    def _key(text: str) -> bytes:
+        """Ключ кэша — хэш нормализованного текста."""
+        return hashlib.blake2b(text.strip().lower().encode(), digest_size=16).digest()
+
+    def get(self, text: str) -> Optional[APIResponse]:
+        """Возвращает копию сохранённого ответа или None, если его нет или он устарел."""
+        key = self._key(text)
+        item = self._items.get(key)
+        if item is None:
+            return None
+
+        expires_at, response = item
+        if expires_at < time.monotonic():
+            del self._items[key]
+            return None
+
+        self._items.move_to_end(key)
+        return APIResponse(success=True, data=dict(response.data))
+
+    def put(self, text: str, response: APIResponse) -> None:
+        """Сохраняет ответ, вытесняя самые давние записи при переполнении."""
+        key = self._key(text)
+        self._items[key] = (time.monotonic() + self.ttl, response)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
 
 class APIClient:
-    def __init__(self, session: aiohttp.ClientSession):
-        self.session = session
-        self.timeout = ClientTimeout(total=config.TIMEOUT)
+    def __init__(self):
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.semaphore: Optional[asyncio.Semaphore] = None
+        self.cache: Optional[ResponseCache] = (
+            ResponseCache(config.CACHE_TTL_S, config.CACHE_MAX) if config.CACHE_ENABLED else None
+        )
+
+    async def start(self) -> None:
+        """Открывает общую HTTP-сессию, переиспользуемую всеми запросами."""
+        connector = TCPConnector(
+            limit=config.CONNECTOR_LIMIT,
+            limit_per_host=config.CONNECTOR_LIMIT_PER_HOST,
+            ttl_dns_cache=300,
+            keepalive_timeout=75,
+            enable_cleanup_closed=True
+        )
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            headers=API_HEADERS,
+            timeout=API_TIMEOUT
+        )
+        # Ограничивает число одновременных запросов, чтобы всплеск сообщений не исчерпал пул соединений
+        self.semaphore = asyncio.Semaphore(config.MAX_CONCURRENT_API_REQUESTS)
+
+    async def close(self) -> None:
+        """Закрывает HTTP-сессию."""
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
 
     async def classify_message(self, text: str) -> APIResponse:
         """Отправляет запрос на классификацию сообщения."""
-        if len(text) > config.MAX_TEXT_LENGTH:
-            logger.warning(f"Текст сообщения превышает {config.MAX_TEXT_LENGTH} символов и будет обрезан")
-            text = text[:config.MAX_TEXT_LENGTH]
-
-        data = {
-            "text": text,
-            "name": None,
-            "topic": None,
-            "generate_answer": True
-        }
-        
+        cached = self.cached(text)
+        if cached is not None:
+            return cached
+
+        response = await self._post(config.API_URL, self._build_payload(text))
+        self.remember(text, response)
+        return response
+
+    def cached(self, text: str) -> Optional[APIResponse]:
+        """Возвращает ранее полученный ответ для такого же текста, если он есть в кэше."""
+        if self.cache is None:
+            return None
+        return self.cache.get(text)
+
+    def remember(self, text: str, response: APIResponse) -> None:
+        """Сохраняет успешный ответ в кэше."""
+        if self.cache is not None and response.success:
+            self.cache.put(text, response)
+
+    async def classify_batch(self, texts: List[str]) -> List[APIResponse]:
+        """Классифицирует несколько сообщений одним запросом к пакетному эндпоинту API.
+
+        Если пакетный эндпоинт не настроен, сообщения отправляются параллельно
+        отдельными запросами через общую сессию.
+        """
+        if not config.BATCH_API_URL:
+            return list(await asyncio.gather(*(self.classify_message(text) for text in texts)))
+
+        response = await self._post(
+            config.BATCH_API_URL,
+            b'{"items":[' + b','.join(self._build_payload(text) for text in texts) + b']}'
+        )
+        if not response.success:
+            return [response] * len(texts)
+
+        items = response.data.get('items')
+        if not isinstance(items, list) or len(items) != len(texts):
+            error = APIResponse(success=False, error="API вернул некорректный пакетный ответ")
+            return [error] * len(texts)
+
+        responses = [APIResponse(success=True, data=item) for item in items]
+        for text, item_response in zip(texts, responses):
+            self.remember(text, item_response)
+        return responses
+
+    @staticmethod
+    def _build_payload(text: str) -> bytes:
+        """Формирует JSON-тело запроса на классификацию одного сообщения."""
+        if TRUNCATE_AT is not None and len(text) > TRUNCATE_AT:
+            logger.warning("Текст сообщения превышает %d символов и будет обрезан", TRUNCATE_AT)
+            text = text[:TRUNCATE_AT]
+
+        return PAYLOAD_PREFIX + json_dumps(text) + PAYLOAD_SUFFIX
+
+    @staticmethod
+    async def _read_body(response: aiohttp.ClientResponse) -> Optional[bytearray]:
+        """Читает тело ответа частями; возвращает None, если оно больше MAX_RESPONSE_SIZE."""
+        if response.content_length is not None and response.content_length > config.MAX_RESPONSE_SIZE:
+            return None
+
+        body = bytearray()
+        async for chunk in response.content.iter_chunked(8192):
+            body.extend(chunk)
+            if len(body) > config.MAX_RESPONSE_SIZE:
+                return None
+        return body
+
+    async def _post(self, url: str, data: bytes) -> APIResponse:
+        """Отправляет запрос к API и оборачивает результат в APIResponse."""
         try:
-            async with self.session.post(
-                config.API_URL,
-                json=data,
-                headers={"Content-Type": "application/json"},
-                timeout=self.timeout
-            ) as response:
-                response_text = await response.text()
-                logger.debug(f"API ответ: {response_text}")
+            async with self.semaphore, self.session.post(url, data=data) as response:
+                body = await self._read_body(response)
+                if body is None:
+                    return APIResponse(success=False, error="Ответ API превышает допустимый размер")
                 
                 if response.status == 200:
-                    result = await response.json()
-                    return APIResponse(success=True, data=result)
+                    return APIResponse(success=True, data=json_loads(body))
                     
+                logger.warning(
+                    "API вернул статус %s: %s",
+                    response.status,
+                    bytes(body[:512]).decode('utf-8', 'replace')
+                )
                 return APIResponse(
                     success=False, 
-                    error=f"API вернул статус {response.status}: {response_text}"
+                    error=f"API вернул статус {response.status}",
+                    retryable=response.status >= 500 or response.status == 429
                 )
                 
         except asyncio.TimeoutError:
-            return APIResponse(success=False, error="Превышено время ожидания ответа")
+            return APIResponse(success=False, error="Превышено время ожидания ответа", retryable=True)
+        except aiohttp.ClientConnectionError as e:
+            return APIResponse(success=False, error=str(e), retryable=True)
         except Exception as e:
             return APIResponse(success=False, error=str(e))
 
+class BatchingAPIClient:
+    """Накапливает сообщения в течение короткого окна и отправляет их в API пачкой."""
+
+    def __init__(self, client: APIClient):
+        self.client = client
+        self.queue: Optional[asyncio.Queue] = None
+        self._collector: Optional[asyncio.Task] = None
+        self._flushes: Set[asyncio.Task] = set()
+
+    async def start(self) -> None:
+        """Открывает сессию клиента и запускает фоновый сбор пачек."""
+        await self.client.start()
+        self.queue = asyncio.Queue()
+        self._collector = asyncio.create_task(self._collect())
+
+    async def close(self) -> None:
+        """Останавливает сбор пачек, дожидается отправленных запросов и закрывает сессию."""
+        if self._collector is not None:
+            self._collector.cancel()
+            try:
+                await self._collector
+            except asyncio.CancelledError:
+                pass
+            self._collector = None
+
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
+
+        # Сообщения, так и не попавшие в пачку, завершаем ошибкой
+        while self.queue is not None and not self.queue.empty():
+            self._reject([self.queue.get_nowait()])
+
+        await self.client.close()
+
+    async def classify_message(self, text: str) -> APIResponse:
+        """Ставит сообщение в очередь и ожидает результат его классификации."""
+        cached = self.client.cached(text)
+        if cached is not None:
+            return cached
+
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((text, future))
+        return await future
+
+    async def _collect(self) -> None:
+        """Собирает до BATCH_MAX сообщений за BATCH_FLUSH_MS и отправляет их одной пачкой."""
+        loop = asyncio.get_running_loop()
+        flush_interval = config.BATCH_FLUSH_MS / 1000
+
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + flush_interval
+
+            try:
+                while len(batch) < config.BATCH_MAX:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+            except asyncio.CancelledError:
+                # Клиент закрывается: недособранная пачка уже не будет отправлена
+                self._reject(batch)
+                raise
+
+            # Отправляем пачку в фоне, чтобы не задерживать сбор следующей
+            task = asyncio.create_task(self._flush(batch))
+            self._flushes.add(task)
+            task.add_done_callback(self._flushes.discard)
+
+    @staticmethod
+    def _reject(batch: List[Tuple[str, asyncio.Future]]) -> None:
+        """Завершает ожидание сообщений, которые уже не будут отправлены."""
+        for _, future in batch:
+            if not future.done():
+                future.set_result(APIResponse(success=False, error="Клиент API остановлен"))
+
+    async def _flush(self, batch: List[Tuple[str, asyncio.Future]]) -> None:
+        """Отправляет пачку в API и передаёт каждому ожидающему его результат."""
+        try:
+            responses = await self.client.classify_batch([text for text, _ in batch])
+        except Exception as e:
+            responses = [APIResponse(success=False, error=str(e))] * len(batch)
+
+        for (_, future), response in zip(batch, responses):
+            if not future.done():
+                future.set_result(response)
+
+api_client = APIClient()
+classifier = BatchingAPIClient(api_client) if config.BATCH_ENABLED else api_client
+
+# Названия атрибутов для ответа об успешной классификации
+_ATTR_NAMES_CLASSIFY = {
+    "equipment_type": "Тип оборудования",
+    "failure_point": "Тип неисправности",
+    "serial_number": "Серийный номер"
+}
+
+# Названия атрибутов для запроса дополнительной информации
+_ATTR_NAMES_MISSING = {
+    "equipment_type": "тип оборудования",
+    "failure_point": "тип неисправности",
+    "serial_number": "серийный номер"
+}
+
 class MessageFormatter:
     @staticmethod
-    def format_successful_classification(attributes: List[Dict[str, str]], keywords: Optional[List[str]] = None) -> str:
+    def format_successful_classification(attributes: Iterable[Tuple[str, Any]], keywords: Optional[List[str]] = None) -> str:
         """Форматирует успешный ответ классификации."""
-        attr_names = {
-            "equipment_type": "Тип оборудования",
-            "failure_point": "Тип неисправности",
-            "serial_number": "Серийный номер"
-        }
-        
-        reply = "✅ Заявка успешно классифицирована:\n\n"
-        
-        for attr in attributes:
-            name = attr_names.get(attr['name'], attr['name'])
-            reply += f"🔹 {name}: {attr['value']}\n"
+        parts = ["✅ Заявка успешно классифицирована:\n\n"]
+        parts.extend(
+            f"🔹 {_ATTR_NAMES_CLASSIFY.get(name, name)}: {value}\n"
+            for name, value in attributes
+        )
         
         if keywords:
-            reply += f"\n🔑 Ключевые слова: {', '.join(keywords)}"
+            parts.append(f"\n🔑 Ключевые слова: {', '.join(keywords)}")
             
-        return reply
+        return "".join(parts)
 
     @staticmethod
-    def format_missing_info(missing_attrs: List[str], recognized_attrs: Optional[List[Dict[str, str]]] = None) -> str:
+    def format_missing_info(missing_attrs: List[str], recognized_attrs: Optional[List[Tuple[str, Any]]] = None) -> str:
         """Форматирует ответ с запросом дополнительной информации."""
-        attr_names = {
-            "equipment_type": "тип оборудования",
-            "failure_point": "тип неисправности",
-            "serial_number": "серийный номер"
-        }
-        
-        reply = "⚠️ Для обработки заявки требуется дополнительная информация\n\n"
+        parts = ["⚠️ Для обработки заявки требуется дополнительная информация\n\n"]
         
         if recognized_attrs:
-            reply += "✓ Уже распознано:\n"
-            for attr in recognized_attrs:
-                name = attr_names.get(attr['name'], attr['name'])
-                reply += f"- {name}: {attr['value']}\n"
-            reply += "\n"
+            parts.append("✓ Уже распознано:\n")
+            parts.extend(
+                f"- {_ATTR_NAMES_MISSING.get(name, name)}: {value}\n"
+                for name, value in recognized_attrs
+            )
+            parts.append("\n")
             
-        reply += "❗️ Пожалуйста, уточните:\n"
-        for attr in missing_attrs:
-            readable_name = attr_names.get(attr, attr)
-            reply += f"- {readable_name}\n"
+        parts.append("❗️ Пожалуйста, уточните:\n")
+        parts.extend(f"- {_ATTR_NAMES_MISSING.get(attr, attr)}\n" for attr in missing_attrs)
             
-        return reply
+        return "".join(parts)
+
+class TokenBucket:
+    """Ограничитель частоты запросов по алгоритму token bucket.
+
+    Токены пополняются со скоростью rate в секунду, но не больше burst.
+    Если токенов нет, acquire() резервирует следующий и ждёт его появления,
+    поэтому ожидающие вызовы обслуживаются по очереди без блокировок.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    async def acquire(self) -> None:
+        """Ожидает, пока не станет доступен токен."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        if self.tokens < 0:
+            await asyncio.sleep(-self.tokens / self.rate)
+
+# Telegram допускает около 30 сообщений в секунду от бота и 1 сообщение в секунду в один чат;
+# общий лимит держим чуть ниже, чтобы оставить запас
+bot_bucket = TokenBucket(rate=28, burst=30)
+CHAT_RATE = 1
+
+async def send_reply(message, text: str, chat_bucket: Optional[TokenBucket] = None) -> None:
+    """Отвечает на сообщение с соблюдением ограничений Telegram на частоту отправки."""
+    if chat_bucket is not None:
+        await chat_bucket.acquire()
+    await bot_bucket.acquire()
+    await bot.reply_to(message, text)
+
+class ChatWorkers:
+    """Очереди сообщений по чатам.
+
+    Сообщения одного чата обрабатываются строго по порядку, разные чаты —
+    параллельно. Обработчик чата запускается при первом сообщении и
+    завершается после CHAT_IDLE_TIMEOUT секунд простоя. Все ответы в чат
+    проходят через его ограничитель частоты.
+    """
+
+    def __init__(self, handler: Callable[[Any, TokenBucket], Awaitable[None]]):
+        self.handler = handler
+        self.queues: Dict[int, asyncio.Queue] = {}
+        self.tasks: Dict[int, asyncio.Task] = {}
+
+    def submit(self, message, handler: Optional[Callable[[Any, TokenBucket], Awaitable[None]]] = None) -> None:
+        """Ставит сообщение в очередь его чата, при необходимости запуская обработчик.
+
+        handler позволяет обработать сообщение иначе, чем обработчиком по умолчанию
+        (например, команду), сохранив порядок и ограничения чата.
+        """
+        chat_id = message.chat.id
+        chat_queue = self.queues.get(chat_id)
+        if chat_queue is None:
+            chat_queue = self.queues[chat_id] = asyncio.Queue()
+            self.tasks[chat_id] = asyncio.create_task(self._work(chat_id, chat_queue))
+        chat_queue.put_nowait((handler or self.handler, message))
+
+    async def _work(self, chat_id: int, chat_queue: asyncio.Queue) -> None:
+        """Последовательно обрабатывает сообщения одного чата."""
+        chat_bucket = TokenBucket(rate=CHAT_RATE, burst=1)
+        try:
+            while True:
+                try:
+                    handler, message = await asyncio.wait_for(chat_queue.get(), config.CHAT_IDLE_TIMEOUT)
+                except asyncio.TimeoutError:
+                    if chat_queue.empty():
+                        break
+                    continue
+
+                try:
+                    await handler(message, chat_bucket)
+                except Exception as e:
+                    logger.error("Ошибка при обработке сообщения в чате %s: %s", chat_id, e, exc_info=True)
+        finally:
+            self.queues.pop(chat_id, None)
+            self.tasks.pop(chat_id, None)
+
+    async def close(self) -> None:
+        """Отменяет обработчики всех чатов и дожидается их завершения."""
+        tasks = list(self.tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+def retry_delay(attempt: int) -> float:
+    """Вычисляет задержку перед повторной попыткой: экспоненциальный рост со случайным разбросом."""
+    delay = config.RETRY_BASE * (2 ** attempt) * (1 + random.random() * config.RETRY_JITTER)
+    return min(delay, config.RETRY_MAX)
 
-async def process_api_response(response: APIResponse) -> str:
+ERROR_REPLY = "Произошла ошибка при обработке заявки. Пожалуйста, попробуйте позже."
+
+def process_api_response(response: APIResponse) -> str:
     """Обрабатывает ответ API и формирует сообщение для пользователя."""
     if not response.success:
-        logger.error(f"Ошибка API: {response.error}")
-        return "Произошла ошибка при обработке заявки. Пожалуйста, попробуйте позже."
+        logger.error("Ошибка API: %s", response.error)
+        return ERROR_REPLY
 
     data = response.data
     
-    # Если есть готовый ответ от API
-    if data.get('answer'):
-        return data['answer']
+    # Если есть готовый ответ от API, остальные поля не нужны
+    answer = data.get('answer')
+    if answer:
+        return answer
         
-    # Нормализуем атрибуты
-    if isinstance(data.get('attributes'), dict):
-        data['attributes'] = [
-            {'name': name, 'value': value}
-            for name, value in data['attributes'].items()
-            if value is not None
-        ]
+    # Приводим атрибуты к парам (название, значение): API возвращает их словарём или списком
+    attrs_raw = data.get('attributes')
+    if isinstance(attrs_raw, dict):
+        attributes = [(name, value) for name, value in attrs_raw.items() if value is not None]
+    elif isinstance(attrs_raw, list):
+        attributes = [(attr['name'], attr['value']) for attr in attrs_raw if attr.get('value') is not None]
+    else:
+        attributes = []
     
     if data.get('valid'):
         return MessageFormatter.format_successful_classification(
-            data.get('attributes', []),
+            attributes,
             data.get('keywords', [])
         )
     else:
         return MessageFormatter.format_missing_info(
             data.get('missingAttributes', []),
-            data.get('attributes', [])
+            attributes
         )
 
+# Ответ на /start и /help одинаков, поэтому храним его в единственном экземпляре
+START_TEXT = (
+    "Привет! Я бот для классификации заявок в техподдержку. 🤖\n\n"
+    "Для корректной классификации укажите в заявке:\n"
+    "- Тип оборудования (например: ноутбук, сервер, коммутатор)\n"
+    "- Тип неисправности (например: не включается, не работает экран, зависает)\n"
+    "- Серийный номер (если есть)\n\n"
+    "Пример заявки:\n"
+    "'Не работает ноутбук HP, серийный номер ABC123. Не включается совсем.'\n\n"
+    "Отправьте мне описание вашей проблемы, и я помогу её классифицировать! 👍"
+)
+
+async def send_start(message, chat_bucket: TokenBucket):
+    """Отправляет приветствие с инструкцией."""
+    await send_reply(message, START_TEXT, chat_bucket)
+
 @bot.message_handler(commands=['start', 'help'])
 async def start_message(message):
-    """Обработчик команд /start и /help."""
-    logger.info(f"Пользователь {message.from_user.id} запустил команду {message.text}")
-    await bot.reply_to(message, 
-        "Привет! Я бот для классификации заявок в техподдержку. 🤖\n\n"
-        "Для корректной классификации укажите в заявке:\n"
-        "- Тип оборудования (например: ноутбук, сервер, коммутатор)\n"
-        "- Тип неисправности (например: не включается, не работает экран, зависает)\n"
-        "- Серийный номер (если есть)\n\n"
-        "Пример заявки:\n"
-        "'Не работает ноутбук HP, серийный номер ABC123. Не включается совсем.'\n\n"
-        "Отправьте мне описание вашей проблемы, и я помогу её классифицировать! 👍"
-    )
+    """Обработчик команд /start и /help: отвечает через очередь чата с учётом его лимита."""
+    logger.info("Пользователь %s запустил команду %s", message.from_user.id, message.text)
+    chat_workers.submit(message, send_start)
 
-@bot.message_handler(func=lambda message: True)
-async def handle_message(message):
-    """Обработчик всех текстовых сообщений."""
+async def process_message(message, chat_bucket: TokenBucket):
+    """Классифицирует сообщение пользователя и отправляет ответ."""
     user_id = message.from_user.id
-    logger.info(f"Получено сообщение от пользователя {user_id}: {message.text}")
+    logger.info("Получено сообщение от пользователя %s: %s", user_id, message.text)
     
-    connector = TCPConnector(force_close=True)
-    async with aiohttp.ClientSession(connector=connector) as session:
-        api_client = APIClient(session)
-        
-        for attempt in range(config.MAX_RETRIES):
-            try:
-                response = await api_client.classify_message(message.text)
-                reply = await process_api_response(response)
-                await bot.reply_to(message, reply)
-                break
-            except Exception as e:
-                logger.error(f"Попытка {attempt + 1} не удалась: {str(e)}")
-                if attempt == config.MAX_RETRIES - 1:
-                    await bot.reply_to(
-                        message,
-                        "Извините, произошла ошибка при обработке вашего сообщения. "
-                        "Пожалуйста, попробуйте позже."
-                    )
-                else:
-                    await asyncio.sleep(config.RETRY_DELAY)
+    for attempt in range(config.MAX_RETRIES):
+        try:
+            response = await classifier.classify_message(message.text)
+            if not response.success and response.retryable and attempt < config.MAX_RETRIES - 1:
+                logger.warning("Попытка %d не удалась: %s", attempt + 1, response.error)
+                await asyncio.sleep(retry_delay(attempt))
+                continue
+            reply = process_api_response(response)
+            await send_reply(message, reply, chat_bucket)
+            break
+        except Exception as e:
+            logger.error("Попытка %d не удалась: %s", attempt + 1, e)
+            if attempt == config.MAX_RETRIES - 1:
+                await send_reply(
+                    message,
+                    "Извините, произошла ошибка при обработке вашего сообщения. "
+                    "Пожалуйста, попробуйте позже.",
+                    chat_bucket
+                )
+            else:
+                await asyncio.sleep(retry_delay(attempt))
+
+chat_workers = ChatWorkers(process_message)
+
+@bot.message_handler(func=lambda message: True)
+async def handle_message(message):
+    """Обработчик всех текстовых сообщений: передаёт сообщение в очередь его чата."""
+    chat_workers.submit(message)
 
 async def main():
     """Основная функция запуска бота."""
     logger.info("Запуск бота...")
-    while True:
+    await classifier.start()
+
+    # Long polling: getUpdates держит соединение до 50 секунд, переподключение выполняет сама библиотека
+    polling = asyncio.ensure_future(
+        bot.infinity_polling(timeout=50, request_timeout=60, logger_level=logging.ERROR)
+    )
+
+    def stop() -> None:
+        logger.info("Остановка бота...")
+        polling.cancel()
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
         try:
-            await bot.polling(non_stop=True, timeout=60)
-        except Exception as e:
-            logger.error(f"Ошибка в работе бота: {str(e)}", exc_info=True)
-            await asyncio.sleep(5)  # Пауза перед перезапуском
-            logger.info("Перезапуск бота...")
+            loop.add_signal_handler(sig, stop)
+        except NotImplementedError:  # Windows: остановка по Ctrl+C обрабатывается asyncio.run
+            pass
+
+    # pyTelegramBotAPI сам перехватывает отмену и штатно завершает polling
+    try:
+        await polling
+    finally:
+        await chat_workers.close()
+        await classifier.close()
+        # Сессия pyTelegramBotAPI создаётся первым запросом и может отсутствовать
+        if asyncio_helper.session_manager.session is not None:
+            await bot.close_session()
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    try:
+        import uvloop
+        uvloop.install()
+    except ImportError:  # uvloop недоступен (например, на Windows) — используем стандартный event loop
+        pass
+    asyncio.run(main())
@@ -1,14 +1,84 @@
-from pydantic_settings import BaseSettings
+import os
+from dataclasses import dataclass
 
-class Settings(BaseSettings):
+
+def _env_bool(name: str, default: str) -> bool:
+    return os.getenv(name, default).lower() in ('1', 'true', 'yes')
+
+
+def _load_dotenv() -> None:
+    """Загружает .env, если переменные не заданы окружением процесса (systemd, docker)."""
+    if os.getenv('LOAD_DOTENV', '1') != '1' or os.getenv('BOT_TOKEN'):
+        return
+    try:
+        from dotenv import load_dotenv
+    except ImportError:  # python-dotenv не установлен — настройки берутся только из окружения
+        return
+    load_dotenv()
+
+
+@dataclass(frozen=True)
+class Config:
     # Telegram settings
-    TELEGRAM_TOKEN: str = ""
-    
+    BOT_TOKEN: str
+
     # API settings
-    API_BASE_URL: str = "http://localhost:8080"
-    API_ENDPOINT: str = "/api/analyze"
-    
-    class Config:
-        env_file = ".env"
+    API_URL: str
+    MAX_RETRIES: int
+    TIMEOUT: int  # Увеличенный таймаут
+    MAX_TEXT_LENGTH: int
+    MAX_RESPONSE_SIZE: int  # Максимальный размер ответа API в байтах
+    # Экспоненциальная задержка между попытками со случайным разбросом
+    RETRY_BASE: float
+    RETRY_MAX: float
+    RETRY_JITTER: float
+    # API классификатора — один хост, поэтому фактическим ограничением является CONNECTOR_LIMIT_PER_HOST
+    CONNECTOR_LIMIT: int
+    CONNECTOR_LIMIT_PER_HOST: int
+    # Пакетная отправка сообщений в API; без BATCH_API_URL пачка уходит параллельными одиночными запросами
+    BATCH_ENABLED: bool
+    BATCH_API_URL: str
+    BATCH_FLUSH_MS: int
+    BATCH_MAX: int
+    # Одновременных запросов к API не больше MAX_CONCURRENT_API_REQUESTS (по умолчанию — лимит соединений с хостом)
+    MAX_CONCURRENT_API_REQUESTS: int
+    CHAT_IDLE_TIMEOUT: float
+    # Кэш ответов API для повторяющихся текстов
+    CACHE_ENABLED: bool
+    CACHE_TTL_S: float
+    CACHE_MAX: int
+
+    def __post_init__(self):
+        if not self.BOT_TOKEN:
+            raise ValueError("BOT_TOKEN не найден в .env файле")
+
+    @classmethod
+    def from_env(cls) -> "Config":
+        """Читает настройки из переменных окружения и файла .env."""
+        _load_dotenv()
+        connector_limit_per_host = os.getenv('CONNECTOR_LIMIT_PER_HOST', '256')
+        return cls(
+            BOT_TOKEN=os.getenv('BOT_TOKEN', ''),
+            API_URL=os.getenv('API_URL', ''),
+            MAX_RETRIES=int(os.getenv('MAX_RETRIES', '3')),
+            TIMEOUT=int(os.getenv('TIMEOUT', '120')),
+            MAX_TEXT_LENGTH=int(os.getenv('MAX_TEXT_LENGTH', '4096')),
+            MAX_RESPONSE_SIZE=int(os.getenv('MAX_RESPONSE_SIZE', str(1024 * 1024))),
+            RETRY_BASE=float(os.getenv('RETRY_BASE', '1.0')),
+            RETRY_MAX=float(os.getenv('RETRY_MAX', '30.0')),
+            RETRY_JITTER=float(os.getenv('RETRY_JITTER', '0.5')),
+            CONNECTOR_LIMIT=int(os.getenv('CONNECTOR_LIMIT', '1000')),
+            CONNECTOR_LIMIT_PER_HOST=int(connector_limit_per_host),
+            BATCH_ENABLED=_env_bool('BATCH_ENABLED', 'false'),
+            BATCH_API_URL=os.getenv('BATCH_API_URL', ''),
+            BATCH_FLUSH_MS=int(os.getenv('BATCH_FLUSH_MS', '30')),
+            BATCH_MAX=int(os.getenv('BATCH_MAX', '32')),
+            MAX_CONCURRENT_API_REQUESTS=int(os.getenv('MAX_CONCURRENT_API_REQUESTS', connector_limit_per_host)),
+            CHAT_IDLE_TIMEOUT=float(os.getenv('CHAT_IDLE_TIMEOUT', '60')),
+            CACHE_ENABLED=_env_bool('CACHE_ENABLED', 'true'),
+            CACHE_TTL_S=float(os.getenv('CACHE_TTL_S', '300')),
+            CACHE_MAX=int(os.getenv('CACHE_MAX', '4096')),
+        )
+
 
-settings = Settings()
\ No newline at end of file
+config = Config.from_env()
@@ -0,0 +1,231 @@
+import asyncio
+import dataclasses
+import importlib
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("aiohttp")
+pytest.importorskip("telebot")
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+
+@pytest.fixture(scope="module")
+def bot_module(tmp_path_factory):
+    # При импорте бот открывает bot.log в текущем каталоге, поэтому импортируем его во временном
+    os.environ.setdefault("BOT_TOKEN", "000000000:test-token")
+    os.environ.setdefault("LOAD_DOTENV", "0")
+    sys.path.insert(0, SRC_DIR)
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp("bot"))
+    try:
+        return importlib.import_module("bot")
+    finally:
+        os.chdir(cwd)
+
+
+def use_config(monkeypatch, bot_module, **changes):
+    monkeypatch.setattr(bot_module, "config", dataclasses.replace(bot_module.config, **changes))
+
+
+class FakeClient:
+    """Заглушка APIClient, запоминающая отправленные пачки."""
+
+    def __init__(self, bot_module):
+        self.api_response = bot_module.APIResponse
+        self.batches = []
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    def cached(self, text):
+        return None
+
+    async def classify_batch(self, texts):
+        self.batches.append(list(texts))
+        return [self.api_response(success=True, data={"answer": text}) for text in texts]
+
+
+def test_send_reply_calls_reply_to_once(bot_module, monkeypatch):
+    calls = []
+
+    async def fake_reply_to(message, text):
+        calls.append((message, text))
+
+    monkeypatch.setattr(bot_module.bot, "reply_to", fake_reply_to)
+    monkeypatch.setattr(bot_module, "bot_bucket", bot_module.TokenBucket(rate=28, burst=30))
+
+    message = object()
+    asyncio.run(bot_module.send_reply(message, "привет"))
+    asyncio.run(bot_module.send_reply(message, "ещё раз", bot_module.TokenBucket(rate=1, burst=1)))
+
+    assert calls == [(message, "привет"), (message, "ещё раз")]
+
+
+def test_batching_flushes_when_batch_is_full(bot_module, monkeypatch):
+    use_config(monkeypatch, bot_module, BATCH_MAX=3, BATCH_FLUSH_MS=60_000)
+    fake = FakeClient(bot_module)
+
+    async def run():
+        client = bot_module.BatchingAPIClient(fake)
+        await client.start()
+        try:
+            return await asyncio.wait_for(
+                asyncio.gather(*(client.classify_message(text) for text in "abc")), 1
+            )
+        finally:
+            await client.close()
+
+    responses = asyncio.run(run())
+
+    assert fake.batches == [["a", "b", "c"]]
+    assert [response.data["answer"] for response in responses] == ["a", "b", "c"]
+
+
+def test_batching_flushes_after_window(bot_module, monkeypatch):
+    use_config(monkeypatch, bot_module, BATCH_MAX=100, BATCH_FLUSH_MS=20)
+    fake = FakeClient(bot_module)
+
+    async def run():
+        client = bot_module.BatchingAPIClient(fake)
+        await client.start()
+        try:
+            return await asyncio.wait_for(
+                asyncio.gather(client.classify_message("a"), client.classify_message("b")), 1
+            )
+        finally:
+            await client.close()
+
+    responses = asyncio.run(run())
+
+    assert fake.batches == [["a", "b"]]
+    assert all(response.success for response in responses)
+
+
+def test_batching_close_resolves_pending_messages(bot_module, monkeypatch):
+    use_config(monkeypatch, bot_module, BATCH_MAX=100, BATCH_FLUSH_MS=60_000)
+    fake = FakeClient(bot_module)
+
+    async def run():
+        client = bot_module.BatchingAPIClient(fake)
+        await client.start()
+        pending = asyncio.ensure_future(client.classify_message("a"))
+        await asyncio.sleep(0.01)  # сообщение уже в недособранной пачке
+        await client.close()
+        return await asyncio.wait_for(pending, 1)
+
+    response = asyncio.run(run())
+
+    assert not response.success
+    assert fake.batches == []
+
+
+def test_batch_response_with_wrong_item_count_fails_every_message(bot_module, monkeypatch):
+    use_config(monkeypatch, bot_module, BATCH_API_URL="http://api/batch", CACHE_ENABLED=False)
+    client = bot_module.APIClient()
+
+    async def fake_post(url, data):
+        return bot_module.APIResponse(success=True, data={"items": [{"valid": True}]})
+
+    client._post = fake_post
+
+    responses = asyncio.run(client.classify_batch(["a", "b"]))
+
+    assert len(responses) == 2
+    assert all(not response.success for response in responses)
+    assert responses[0].error == responses[1].error
+
+
+def test_cache_entry_expires_after_ttl(bot_module, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(bot_module.time, "monotonic", lambda: now[0])
+    cache = bot_module.ResponseCache(ttl=10, max_size=10)
+
+    cache.put("Ноутбук не включается", bot_module.APIResponse(success=True, data={"valid": True}))
+    now[0] += 5
+    assert cache.get("  ноутбук НЕ включается ") is not None
+    now[0] += 6
+    assert cache.get("Ноутбук не включается") is None
+
+
+def test_cache_evicts_least_recently_used(bot_module):
+    cache = bot_module.ResponseCache(ttl=60, max_size=2)
+
+    cache.put("a", bot_module.APIResponse(success=True, data={"text": "a"}))
+    cache.put("b", bot_module.APIResponse(success=True, data={"text": "b"}))
+    assert cache.get("a") is not None
+    cache.put("c", bot_module.APIResponse(success=True, data={"text": "c"}))
+
+    assert cache.get("b") is None
+    assert cache.get("a").data == {"text": "a"}
+    assert cache.get("c").data == {"text": "c"}
+
+
+def test_cache_hit_returns_copy(bot_module):
+    cache = bot_module.ResponseCache(ttl=60, max_size=10)
+    stored = bot_module.APIResponse(success=True, data={"valid": True})
+    cache.put("a", stored)
+
+    hit = cache.get("a")
+    hit.data["valid"] = False
+
+    assert hit is not stored
+    assert cache.get("a").data == {"valid": True}
+
+
+def test_token_bucket_paces_after_burst(bot_module, monkeypatch):
+    monkeypatch.setattr(bot_module.time, "monotonic", lambda: 1000.0)
+    delays = []
+
+    async def fake_sleep(delay):
+        delays.append(round(delay, 6))
+
+    monkeypatch.setattr(bot_module.asyncio, "sleep", fake_sleep)
+    bucket = bot_module.TokenBucket(rate=10, burst=2)
+
+    async def run():
+        for _ in range(4):
+            await bucket.acquire()
+
+    asyncio.run(run())
+
+    # Два токена из запаса выдаются сразу, следующие — через 0.1 и 0.2 секунды
+    assert delays == [0.1, 0.2]
+
+
+def test_start_command_goes_through_chat_queue_and_bucket(bot_module, monkeypatch):
+    calls = []
+
+    async def fake_send_reply(message, text, chat_bucket=None):
+        calls.append((message, text, chat_bucket))
+
+    async def default_handler(message, chat_bucket):
+        calls.append((message, "default", chat_bucket))
+
+    monkeypatch.setattr(bot_module, "send_reply", fake_send_reply)
+    chat = type("Chat", (), {"id": 42})()
+    user = type("User", (), {"id": 7})()
+    start = type("Message", (), {"chat": chat, "from_user": user, "text": "/start"})()
+    text = type("Message", (), {"chat": chat, "from_user": user, "text": "ноутбук"})()
+
+    async def run():
+        workers = bot_module.ChatWorkers(default_handler)
+        monkeypatch.setattr(bot_module, "chat_workers", workers)
+        await bot_module.start_message(start)
+        workers.submit(text)
+        await asyncio.sleep(0.01)
+        await workers.close()
+
+    asyncio.run(run())
+
+    assert [(message, reply) for message, reply, _ in calls] == [
+        (start, bot_module.START_TEXT),
+        (text, "default"),
+    ]
+    assert calls[0][2] is not None
+    assert calls[0][2] is calls[1][2]